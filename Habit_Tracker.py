@@ -7,15 +7,18 @@ Run with:
 
 from __future__ import annotations
 
+import re
+import time
 from datetime import date, datetime, timedelta
+from functools import lru_cache
 
-import altair as alt
+import numpy as np
 import pandas as pd
 import streamlit as st
 
 from habit_tracker import init_db
 from habit_tracker import db
-from habit_tracker.metrics import is_due_on, success_rate, current_streak
+from habit_tracker.metrics import is_due_on_batch, prepare_habits, success_rate, current_streak
 from habit_tracker.ui_helpers import app_header, now_iso, toast_success
 
 
@@ -29,12 +32,21 @@ init_db()
 
 
 
+_HHMM_RE = re.compile(r"\s*(\d{1,2}):(\d{2})\s*")
+
+
 def parse_hhmm(text: str) -> tuple[int, int]:
-    try:
-        hh, mm = text.strip().split(":")
-        return int(hh), int(mm)
-    except Exception:
-        return 18, 0
+    m = _HHMM_RE.fullmatch(text or "")
+    return (int(m[1]), int(m[2])) if m else (18, 0)
+
+
+@lru_cache(maxsize=8)
+def reminder_timestamp(day: str, reminder: str) -> float:
+    """
+    Unix time of the reminder ('HH:MM', local time) on the given day.
+    """
+    hh, mm = parse_hhmm(reminder)
+    return datetime.combine(date.fromisoformat(day), datetime.min.time()).replace(hour=hh, minute=mm).timestamp()
 
 
 def month_bounds(d: date) -> tuple[date, date]:
@@ -48,69 +60,105 @@ def month_bounds(d: date) -> tuple[date, date]:
     return start, end
 
 
-@st.cache_data(ttl=10)
-def load_habits():
+# Keyed by db.data_version(): writes bump it, read-only reruns stay cached.
+# Old versions are never requested again, so only a few entries are kept.
+@st.cache_data(max_entries=4)
+def load_habits(version: int):
     return db.list_habits()
 
 
-@st.cache_data(ttl=10)
-def load_checkins_for_habit(habit_id: int):
-    return db.list_checkins_for_habit(habit_id)
+@st.cache_data(max_entries=4)
+def load_all_checkins_grouped(version: int):
+    return db.list_checkins_by_habit()
 
 
-def daily_progress_frame(habits: list[dict], month_start: date, month_end: date) -> pd.DataFrame:
+@st.cache_data(max_entries=4)
+def load_month_aggregates(start_day: str, end_day: str, version: int):
+    return db.month_aggregates(start_day, end_day)
+
+
+def daily_progress_frame(month_start: date, month_end: date) -> pd.DataFrame:
     """
     Build a per-day frame for the month:
       - due_count, done_count
       - cumulative totals
     """
     days = pd.date_range(month_start, month_end, freq="D")
-    due_counts = {d.date(): 0 for d in days}
-    done_counts = {d.date(): 0 for d in days}
-
-    # Load checkins per habit (small data, local db)
-    for h in habits:
-        checkins = load_checkins_for_habit(h["id"])
-        done_lookup = {c["day"]: int(c.get("done", 0)) for c in checkins}
-        for ts in days:
-            day = ts.date()
-            if is_due_on(h, day):
-                due_counts[day] += 1
-                if done_lookup.get(day.isoformat(), 0) == 1:
-                    done_counts[day] += 1
+    dow = days.weekday.to_numpy()
+
+    # Habits and the month's check-ins come back from one JOIN
+    rows = pd.DataFrame(
+        load_month_aggregates(month_start.isoformat(), month_end.isoformat(), db.data_version()),
+        columns=["id", "schedule_type", "custom_days", "day_ord", "done"],
+    )
+    habits = rows.drop_duplicates("id")[["id", "schedule_type", "custom_days"]].to_dict("records")
+
+    # habit x day boolean matrices
+    prepared = prepare_habits(habits)
+    due_matrix = is_due_on_batch(prepared, dow)
+    done_matrix = np.zeros_like(due_matrix)
+
+    checkins = rows[rows["done"] == 1]
+    if not checkins.empty:
+        habit_idx = pd.Index(prepared["ids"]).get_indexer(checkins["id"])
+        day_idx = checkins["day_ord"].to_numpy(dtype=np.int64) - db.day_ordinal(month_start)
+        done_matrix[habit_idx, day_idx] = True
+
+    due_counts = due_matrix.sum(axis=0)
+    done_counts = (due_matrix & done_matrix).sum(axis=0)
 
     df = pd.DataFrame(
         {
-            "day": [d.date() for d in days],
-            "due": [due_counts[d.date()] for d in days],
-            "done": [done_counts[d.date()] for d in days],
+            "day": days.date,
+            "due": due_counts,
+            "done": done_counts,
+            "cum_due": np.cumsum(due_counts),
+            "cum_done": np.cumsum(done_counts),
         }
     )
-    df["cum_due"] = df["due"].cumsum()
-    df["cum_done"] = df["done"].cumsum()
-    df["completion_rate"] = df.apply(lambda r: (r["done"] / r["due"]) if r["due"] else 0.0, axis=1)
+    df["completion_rate"] = np.divide(
+        done_counts, due_counts, out=np.zeros(len(df)), where=due_counts != 0
+    )
     return df
 
 
 def render_month_progress(df: pd.DataFrame) -> None:
-    chart_df = df.copy()
+    chart_df = df[["day", "due", "done", "cum_due", "cum_done"]].copy()
     chart_df["day"] = pd.to_datetime(chart_df["day"])
 
-    base = alt.Chart(chart_df).encode(
-        x=alt.X("day:T", title="Date")
-    )
-
-    done_line = base.mark_line().encode(
-        y=alt.Y("cum_done:Q", title="Cumulative completions"),
-        tooltip=["day:T", "done:Q", "cum_done:Q", "due:Q", "cum_due:Q"],
-    )
-
-    due_line = base.mark_line(strokeDash=[4, 4]).encode(
-        y=alt.Y("cum_due:Q"),
-        tooltip=["day:T", "due:Q", "cum_due:Q"],
-    )
-
-    st.altair_chart((due_line + done_line).interactive(), use_container_width=True)
+    # Plain Vega-Lite spec: skips Altair's schema validation on every rerun,
+    # and Streamlit ships the frame separately (Arrow) instead of inline JSON.
+    spec = {
+        "encoding": {"x": {"field": "day", "type": "temporal", "title": "Date"}},
+        "layer": [
+            {
+                "mark": {"type": "line", "strokeDash": [4, 4]},
+                "encoding": {
+                    "y": {"field": "cum_due", "type": "quantitative"},
+                    "tooltip": [
+                        {"field": "day", "type": "temporal"},
+                        {"field": "due", "type": "quantitative"},
+                        {"field": "cum_due", "type": "quantitative"},
+                    ],
+                },
+            },
+            {
+                "mark": "line",
+                "params": [{"name": "zoom", "select": "interval", "bind": "scales"}],
+                "encoding": {
+                    "y": {"field": "cum_done", "type": "quantitative", "title": "Cumulative completions"},
+                    "tooltip": [
+                        {"field": "day", "type": "temporal"},
+                        {"field": "done", "type": "quantitative"},
+                        {"field": "cum_done", "type": "quantitative"},
+                        {"field": "due", "type": "quantitative"},
+                        {"field": "cum_due", "type": "quantitative"},
+                    ],
+                },
+            },
+        ],
+    }
+    st.vega_lite_chart(chart_df, spec, use_container_width=True)
 
 
 def render_today(habits: list[dict], today: date) -> None:
@@ -121,25 +169,24 @@ def render_today(habits: list[dict], today: date) -> None:
         st.info("No habits yet. Create one in **Habits**.")
         return
 
+    due_habits = db.list_habits_due_on(today.weekday())
+    if not due_habits:
+        st.success("Nothing scheduled for today.")
+        return
+
+    existing = db.get_checkins_for_day(today.isoformat())
     due_today = []
-    for h in habits:
-        if is_due_on(h, today):
-            c = db.get_checkin(h["id"], today.isoformat())
-            done = bool(c and int(c.get("done", 0)) == 1)
-            due_today.append((h, done, c.get("note", "") if c else ""))
+    for h in due_habits:
+        c = existing.get(h["id"])
+        done = bool(c and int(c.get("done", 0)) == 1)
+        due_today.append((h, done, c.get("note", "") if c else ""))
 
     # Reminder banner (only when something is still open)
     reminder = db.get_setting("reminder_time", "18:00")
-    hh, mm = parse_hhmm(reminder)
-    remind_dt = datetime.combine(today, datetime.min.time()).replace(hour=hh, minute=mm)
     open_items = sum(1 for _, done, _ in due_today if not done)
-    if open_items > 0 and datetime.now() >= remind_dt:
+    if open_items > 0 and time.time() >= reminder_timestamp(today.isoformat(), reminder):
         st.warning(f"Reminder: {open_items} habit(s) still open today. (Settings → reminder time: {reminder})")
 
-    if not due_today:
-        st.success("Nothing scheduled for today.")
-        return
-
     col1, col2 = st.columns([1.2, 1.0], gap="large")
 
     with col1:
@@ -162,14 +209,14 @@ def render_today(habits: list[dict], today: date) -> None:
                         note=note or "",
                         created_at=now_iso(),
                     )
-                    load_checkins_for_habit.clear()
                     toast_success("Saved")
                     st.rerun()
 
     with col2:
         st.markdown("#### Quick stats")
+        all_checkins = load_all_checkins_grouped(db.data_version())
         for h, done, _ in due_today:
-            checkins = load_checkins_for_habit(h["id"])
+            checkins = all_checkins.get(h["id"], [])
             streak = current_streak(h, checkins, today)
             rate_28 = success_rate(h, checkins, today - timedelta(days=27), today)
             st.write(f"**{h['name']}**")
@@ -180,7 +227,7 @@ def render_today(habits: list[dict], today: date) -> None:
 def main() -> None:
     app_header("Habit Tracker", "Log daily habits, track streaks, and spot patterns over time.")
 
-    habits = load_habits()
+    habits = load_habits(db.data_version())
     today = date.today()
 
     # Month selector (for the progress chart)
@@ -193,7 +240,7 @@ def main() -> None:
     st.divider()
     st.subheader("This month")
     if habits:
-        df = daily_progress_frame(habits, month_start, month_end)
+        df = daily_progress_frame(month_start, month_end)
         total_due = int(df["due"].sum())
         total_done = int(df["done"].sum())
         rate = (total_done / total_due) if total_due else 0.0
@@ -8,11 +8,32 @@ from __future__ import annotations
 
 import os
 import sqlite3
+import threading
+import time
 from contextlib import contextmanager
+from datetime import date
+from functools import lru_cache
 from typing import Iterable, Optional, Sequence, Tuple
 
+from .metrics import parse_custom_days
+
 DB_PATH_DEFAULT = os.path.join("data", "habits.db")
 
+EPOCH = date(1970, 1, 1)
+
+# Streamlit serves every session from its own thread, so the shared
+# connection is only ever used while holding this lock.
+_LOCK = threading.RLock()
+
+
+def day_ordinal(day: date | str) -> int:
+    """
+    Date or 'YYYY-MM-DD' -> days since 1970-01-01 (the checkins.day_ord value).
+    """
+    if isinstance(day, str):
+        day = date.fromisoformat(day)
+    return (day - EPOCH).days
+
 
 def _ensure_parent_dir(path: str) -> None:
     parent = os.path.dirname(path)
@@ -20,16 +41,40 @@ def _ensure_parent_dir(path: str) -> None:
         os.makedirs(parent, exist_ok=True)
 
 
-@contextmanager
-def connect(db_path: str = DB_PATH_DEFAULT):
+@lru_cache(maxsize=None)
+def _get_conn(db_path: str) -> sqlite3.Connection:
+    """
+    Open the connection for db_path once and reuse it for every query.
+
+    Per-connection PRAGMAs are applied here so they run a single time.
+    """
     _ensure_parent_dir(db_path)
-    conn = sqlite3.connect(db_path, detect_types=sqlite3.PARSE_DECLTYPES)
+    conn = sqlite3.connect(db_path, detect_types=sqlite3.PARSE_DECLTYPES, check_same_thread=False)
     conn.row_factory = sqlite3.Row
-    try:
-        yield conn
-        conn.commit()
-    finally:
-        conn.close()
+    conn.execute("PRAGMA foreign_keys = ON")
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.execute("PRAGMA temp_store = MEMORY")
+    conn.execute("PRAGMA mmap_size = 268435456")  # 256 MB
+    conn.execute("PRAGMA cache_size = -20000")  # ~20 MB page cache
+    return conn
+
+
+@contextmanager
+def connect(db_path: str = DB_PATH_DEFAULT):
+    """
+    Yield the shared connection; commit on success, roll back on error.
+    """
+    with _LOCK:
+        conn = _get_conn(db_path)
+        try:
+            yield conn
+            conn.commit()
+        except BaseException:
+            # Also on interrupts/reruns: the connection is shared, so an open
+            # transaction would otherwise be committed by the next caller.
+            conn.rollback()
+            raise
 
 
 def init_db(db_path: str = DB_PATH_DEFAULT) -> None:
@@ -55,6 +100,7 @@ def init_db(db_path: str = DB_PATH_DEFAULT) -> None:
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 habit_id INTEGER NOT NULL,
                 day TEXT NOT NULL,                  -- YYYY-MM-DD
+                day_ord INTEGER,                    -- days since 1970-01-01
                 done INTEGER NOT NULL DEFAULT 1,
                 note TEXT DEFAULT '',
                 created_at TEXT NOT NULL,
@@ -63,6 +109,22 @@ def init_db(db_path: str = DB_PATH_DEFAULT) -> None:
             )
             """
         )
+        # Databases created before day_ord existed get it added and backfilled.
+        # The ALTER commits on its own, so the backfill and index drop are
+        # re-checked (read-only) each time in case a migration was interrupted.
+        cols = {r["name"] for r in conn.execute("PRAGMA table_info(checkins)")}
+        if "day_ord" not in cols:
+            conn.execute("ALTER TABLE checkins ADD COLUMN day_ord INTEGER")
+        if conn.execute("SELECT 1 FROM checkins WHERE day_ord IS NULL LIMIT 1").fetchone():
+            conn.execute(
+                "UPDATE checkins SET day_ord = CAST(julianday(day) - 2440587.5 AS INTEGER) WHERE day_ord IS NULL"
+            )
+        if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'idx_checkins_day'").fetchone():
+            conn.execute("DROP INDEX idx_checkins_day")
+        # UNIQUE(habit_id, day) already covers point lookups; these serve
+        # range scans on the integer day and newest-first per-habit history.
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_checkins_day_ord ON checkins(day_ord)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_checkins_habit_day ON checkins(habit_id, day DESC)")
 
         conn.execute(
             """
@@ -72,12 +134,34 @@ def init_db(db_path: str = DB_PATH_DEFAULT) -> None:
             )
             """
         )
+        # Seeded from the clock so a recreated database never reuses the
+        # versions of an old one (cached reads are keyed by it).
+        # Checked first so reruns don't open a write transaction.
+        if conn.execute("SELECT 1 FROM settings WHERE key = 'data_version'").fetchone() is None:
+            conn.execute(
+                "INSERT INTO settings (key, value) VALUES ('data_version', ?)",
+                (str(time.time_ns()),),
+            )
 
-        conn.execute("PRAGMA foreign_keys = ON")
+
+def _bump_version(conn: sqlite3.Connection) -> None:
+    conn.execute(
+        """
+        INSERT INTO settings (key, value) VALUES ('data_version', '1')
+        ON CONFLICT(key) DO UPDATE SET value = CAST(value AS INTEGER) + 1
+        """
+    )
 
 
 # --- Habit CRUD ---------------------------------------------------------------
 
+def _canonical_custom_days(custom_days: str) -> str:
+    """
+    ' 3, 01,x' -> '1,3': the form list_habits_due_on matches against.
+    """
+    return ",".join(str(d) for d in sorted(parse_custom_days(custom_days)))
+
+
 def list_habits(db_path: str = DB_PATH_DEFAULT):
     with connect(db_path) as conn:
         rows = conn.execute(
@@ -86,6 +170,31 @@ def list_habits(db_path: str = DB_PATH_DEFAULT):
     return [dict(r) for r in rows]
 
 
+def list_habits_due_on(weekday: int, db_path: str = DB_PATH_DEFAULT):
+    """
+    Habits scheduled on the given weekday (0..6, Mon..Sun), filtered in SQL
+    with the same rules as metrics.is_due_on.
+
+    Matching custom days relies on the canonical 'd,d,d' form that
+    create_habit/update_habit store.
+    """
+    with connect(db_path) as conn:
+        rows = conn.execute(
+            """
+            SELECT id, name, description, schedule_type, custom_days, created_at
+              FROM habits
+             WHERE schedule_type = 'daily'
+                OR (schedule_type = 'weekdays' AND ? < 5)
+                OR (schedule_type = 'custom'
+                    AND instr(',' || replace(custom_days, ' ', '') || ',', ?) > 0)
+                OR schedule_type NOT IN ('daily', 'weekdays', 'custom')
+             ORDER BY name
+            """,
+            (weekday, f",{weekday},"),
+        ).fetchall()
+    return [dict(r) for r in rows]
+
+
 def get_habit(habit_id: int, db_path: str = DB_PATH_DEFAULT):
     with connect(db_path) as conn:
         row = conn.execute(
@@ -109,8 +218,9 @@ def create_habit(
             INSERT INTO habits (name, description, schedule_type, custom_days, created_at)
             VALUES (?, ?, ?, ?, ?)
             """,
-            (name.strip(), description.strip(), schedule_type, custom_days.strip(), created_at),
+            (name.strip(), description.strip(), schedule_type, _canonical_custom_days(custom_days), created_at),
         )
+        _bump_version(conn)
 
 
 def update_habit(
@@ -128,13 +238,15 @@ def update_habit(
                SET name = ?, description = ?, schedule_type = ?, custom_days = ?
              WHERE id = ?
             """,
-            (name.strip(), description.strip(), schedule_type, custom_days.strip(), habit_id),
+            (name.strip(), description.strip(), schedule_type, _canonical_custom_days(custom_days), habit_id),
         )
+        _bump_version(conn)
 
 
 def delete_habit(habit_id: int, db_path: str = DB_PATH_DEFAULT) -> None:
     with connect(db_path) as conn:
         conn.execute("DELETE FROM habits WHERE id = ?", (habit_id,))
+        _bump_version(conn)
 
 
 # --- Check-ins ---------------------------------------------------------------
@@ -153,14 +265,41 @@ def upsert_checkin(
     with connect(db_path) as conn:
         conn.execute(
             """
-            INSERT INTO checkins (habit_id, day, done, note, created_at)
-            VALUES (?, ?, ?, ?, ?)
+            INSERT INTO checkins (habit_id, day, day_ord, done, note, created_at)
+            VALUES (?, ?, ?, ?, ?, ?)
             ON CONFLICT(habit_id, day) DO UPDATE SET
                 done=excluded.done,
                 note=excluded.note
             """,
-            (habit_id, day, 1 if done else 0, note.strip(), created_at),
+            (habit_id, day, day_ordinal(day), 1 if done else 0, note.strip(), created_at),
         )
+        _bump_version(conn)
+
+
+def upsert_checkins_bulk(
+    rows: Iterable[Tuple[int, str, bool, str, str]],
+    db_path: str = DB_PATH_DEFAULT,
+) -> None:
+    """
+    Same as upsert_checkin for many (habit_id, day, done, note, created_at)
+    rows, written in a single transaction.
+    """
+    params = [
+        (habit_id, day, day_ordinal(day), 1 if done else 0, note.strip(), created_at)
+        for habit_id, day, done, note, created_at in rows
+    ]
+    with connect(db_path) as conn:
+        conn.executemany(
+            """
+            INSERT INTO checkins (habit_id, day, day_ord, done, note, created_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT(habit_id, day) DO UPDATE SET
+                done=excluded.done,
+                note=excluded.note
+            """,
+            params,
+        )
+        _bump_version(conn)
 
 
 def get_checkin(habit_id: int, day: str, db_path: str = DB_PATH_DEFAULT):
@@ -172,6 +311,18 @@ def get_checkin(habit_id: int, day: str, db_path: str = DB_PATH_DEFAULT):
     return dict(row) if row else None
 
 
+def get_checkins_for_day(day: str, db_path: str = DB_PATH_DEFAULT):
+    """
+    All check-ins for one day, keyed by habit_id.
+    """
+    with connect(db_path) as conn:
+        rows = conn.execute(
+            "SELECT habit_id, done, note FROM checkins WHERE day_ord = ?",
+            (day_ordinal(day),),
+        ).fetchall()
+    return {r["habit_id"]: dict(r) for r in rows}
+
+
 def list_checkins_for_habit(habit_id: int, db_path: str = DB_PATH_DEFAULT):
     with connect(db_path) as conn:
         rows = conn.execute(
@@ -181,6 +332,20 @@ def list_checkins_for_habit(habit_id: int, db_path: str = DB_PATH_DEFAULT):
     return [dict(r) for r in rows]
 
 
+def list_checkins_by_habit(db_path: str = DB_PATH_DEFAULT):
+    """
+    All check-ins in one query, grouped as habit_id -> rows ordered by day.
+    """
+    with connect(db_path) as conn:
+        rows = conn.execute(
+            "SELECT habit_id, day, day_ord, done, note FROM checkins ORDER BY habit_id, day_ord"
+        ).fetchall()
+    out = {}
+    for r in rows:
+        out.setdefault(r["habit_id"], []).append(dict(r))
+    return out
+
+
 def list_checkins_between(start_day: str, end_day: str, db_path: str = DB_PATH_DEFAULT):
     """
     Return all check-ins where start_day <= day <= end_day (inclusive).
@@ -188,11 +353,31 @@ def list_checkins_between(start_day: str, end_day: str, db_path: str = DB_PATH_D
     with connect(db_path) as conn:
         rows = conn.execute(
             """
-            SELECT habit_id, day, done, note
+            SELECT habit_id, day, day_ord, done, note
               FROM checkins
-             WHERE day >= ? AND day <= ?
+             WHERE day_ord BETWEEN ? AND ?
             """,
-            (start_day, end_day),
+            (day_ordinal(start_day), day_ordinal(end_day)),
+        ).fetchall()
+    return [dict(r) for r in rows]
+
+
+def month_aggregates(start_day: str, end_day: str, db_path: str = DB_PATH_DEFAULT):
+    """
+    Every habit joined with its check-ins in start_day..end_day (inclusive).
+
+    Habits without a check-in in the window appear once with day_ord/done None.
+    """
+    with connect(db_path) as conn:
+        rows = conn.execute(
+            """
+            SELECT h.id, h.schedule_type, h.custom_days, c.day_ord, c.done
+              FROM habits h
+              LEFT JOIN checkins c
+                ON c.habit_id = h.id AND c.day_ord BETWEEN ? AND ?
+             ORDER BY h.id
+            """,
+            (day_ordinal(start_day), day_ordinal(end_day)),
         ).fetchall()
     return [dict(r) for r in rows]
 
@@ -205,6 +390,13 @@ def get_setting(key: str, default: str = "", db_path: str = DB_PATH_DEFAULT) ->
     return str(row["value"]) if row else default
 
 
+def data_version(db_path: str = DB_PATH_DEFAULT) -> int:
+    """
+    Counter bumped by every habit/check-in write; use it as a cache key.
+    """
+    return int(get_setting("data_version", "0", db_path=db_path))
+
+
 def set_setting(key: str, value: str, db_path: str = DB_PATH_DEFAULT) -> None:
     with connect(db_path) as conn:
         conn.execute(
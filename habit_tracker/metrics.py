@@ -6,21 +6,26 @@ from __future__ import annotations
 
 from dataclasses import dataclass
 from datetime import date, datetime, timedelta
-from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+from functools import lru_cache
+from typing import Dict, FrozenSet, Iterable, List, Optional, Sequence, Set, Tuple
 
+import numpy as np
 import pandas as pd
 
 
 WEEKDAY_NAMES = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]  # 0..6
 
 
-def parse_custom_days(custom_days: str) -> Set[int]:
+@lru_cache(maxsize=256)
+def parse_custom_days(custom_days: str) -> FrozenSet[int]:
     """
     Convert '0,1,2' -> {0,1,2}. Empty string -> empty set.
+
+    Cached, since the same few strings are parsed for every day checked.
     """
     custom_days = (custom_days or "").strip()
     if not custom_days:
-        return set()
+        return frozenset()
     out = set()
     for p in custom_days.split(","):
         p = p.strip()
@@ -30,7 +35,7 @@ def parse_custom_days(custom_days: str) -> Set[int]:
             out.add(int(p))
         except ValueError:
             continue
-    return out
+    return frozenset(out)
 
 
 def is_due_on(habit: dict, d: date) -> bool:
@@ -45,20 +50,78 @@ def is_due_on(habit: dict, d: date) -> bool:
     return True
 
 
+SCHEDULE_CODES = {"daily": 0, "weekdays": 1, "custom": 2}
+
+
+def _schedule_arrays(habits: Sequence[dict]) -> Dict[str, np.ndarray]:
+    n = len(habits)
+    schedule_code = np.zeros(n, dtype=np.uint8)
+    custom_mask = np.zeros(n, dtype=np.uint8)
+    for i, h in enumerate(habits):
+        schedule_code[i] = SCHEDULE_CODES.get(h.get("schedule_type", "daily"), 0)
+        if schedule_code[i] == 2:
+            custom_mask[i] = sum(1 << d for d in parse_custom_days(h.get("custom_days", "")) if 0 <= d <= 6)
+    return {"schedule_code": schedule_code, "custom_mask": custom_mask}
+
+
+def prepare_habits(habits: Sequence[dict]) -> Dict[str, np.ndarray]:
+    """
+    Parse schedules once into parallel arrays:
+      - ids (int64)
+      - schedule_code (0 daily, 1 weekdays, 2 custom)
+      - custom_mask (bit i set when weekday i is allowed)
+    Unknown schedule types count as daily, like is_due_on.
+    """
+    ids = np.array([h["id"] for h in habits], dtype=np.int64)
+    return {"ids": ids, **_schedule_arrays(habits)}
+
+
+def is_due_on_batch(prepared: Dict[str, np.ndarray], dow: np.ndarray) -> np.ndarray:
+    """
+    Habits x days boolean matrix for prepared habits and weekday numbers.
+    """
+    code = prepared["schedule_code"][:, None]
+    custom = prepared["custom_mask"][:, None].astype(np.int64)
+    dow = np.asarray(dow, dtype=np.int64)[None, :]
+    return (
+        (code == 0)
+        | ((code == 1) & (dow < 5))
+        | ((code == 2) & (((custom >> dow) & 1) == 1))
+    )
+
+
+def due_mask(habit: dict, dow: np.ndarray) -> np.ndarray:
+    """
+    Vectorized is_due_on for one habit: weekday numbers (0..6) -> boolean array.
+    """
+    return is_due_on_batch(_schedule_arrays([habit]), dow)[0]
+
+
+def day_array(start: date, end: date) -> np.ndarray:
+    """
+    Inclusive date range as a datetime64[D] array.
+    """
+    return np.arange(np.datetime64(start, "D"), np.datetime64(end, "D") + 1, dtype="datetime64[D]")
+
+
+def weekday_array(days: np.ndarray) -> np.ndarray:
+    """
+    datetime64[D] array -> weekday numbers (0..6, Mon..Sun).
+    """
+    # Day 0 of the epoch (1970-01-01) was a Thursday
+    return (days.view("int64") + 3) % 7
+
+
 def daterange(start: date, end: date) -> List[date]:
     """
     Inclusive date range.
     """
-    days = []
-    cur = start
-    while cur <= end:
-        days.append(cur)
-        cur += timedelta(days=1)
-    return days
+    return day_array(start, end).tolist()
 
 
 def due_days_for_habit(habit: dict, start: date, end: date) -> List[date]:
-    return [d for d in daterange(start, end) if is_due_on(habit, d)]
+    days = day_array(start, end)
+    return days[due_mask(habit, weekday_array(days))].tolist()
 
 
 def checkin_lookup(checkins: Sequence[dict]) -> Dict[str, int]:
@@ -73,40 +136,37 @@ def current_streak(habit: dict, checkins: Sequence[dict], today: date) -> int:
     Count consecutive *due* days ending at today
     where the habit was marked done.
     """
-    lookup = checkin_lookup(checkins)
+    # A schedule with no due weekday would never stop the walk below
+    if not due_mask(habit, np.arange(7)).any():
+        return 0
+    done = {c["day"] for c in checkins if int(c.get("done", 0)) == 1}
     # Walk backwards from today until a miss on a due day
     streak = 0
     cur = today
     while True:
-        if not is_due_on(habit, cur):
-            cur -= timedelta(days=1)
-            # stop if it drifts too far (safety)
-            if streak == 0 and (today - cur).days > 60:
-                return 0
-            continue
-
-        key = cur.isoformat()
-        if lookup.get(key, 0) == 1:
+        if is_due_on(habit, cur):
+            if cur.isoformat() not in done:
+                break
             streak += 1
-            cur -= timedelta(days=1)
-            continue
-        break
+        cur -= timedelta(days=1)
     return streak
 
 
+def done_day_array(checkins: Sequence[dict]) -> np.ndarray:
+    """
+    Days marked done as a datetime64[D] array.
+    """
+    return np.array([c["day"] for c in checkins if int(c.get("done", 0)) == 1], dtype="datetime64[D]")
+
+
 def longest_streak(habit: dict, checkins: Sequence[dict], start: date, end: date) -> int:
-    lookup = checkin_lookup(checkins)
-    longest = 0
-    cur_streak = 0
-    for d in daterange(start, end):
-        if not is_due_on(habit, d):
-            continue
-        if lookup.get(d.isoformat(), 0) == 1:
-            cur_streak += 1
-            longest = max(longest, cur_streak)
-        else:
-            cur_streak = 0
-    return longest
+    days = day_array(start, end)
+    due = days[due_mask(habit, weekday_array(days))]
+    mask = np.isin(due, done_day_array(checkins))
+    # Run boundaries are where the 0/1 sequence changes; pairs give run lengths
+    idx = np.flatnonzero(np.diff(np.r_[0, mask.view(np.int8), 0]))
+    runs = idx[1::2] - idx[::2]
+    return int(runs.max(initial=0))
 
 
 def success_rate(habit: dict, checkins: Sequence[dict], start: date, end: date) -> float:
@@ -121,33 +181,57 @@ def success_rate(habit: dict, checkins: Sequence[dict], start: date, end: date)
     return done / len(due)
 
 
+def _like_row_inference(values: np.ndarray) -> np.ndarray:
+    """
+    Float array with NaN for missing -> the dtype pandas infers from a column
+    of ints and Nones: int64 when nothing is missing, object None when
+    everything is, float64 with NaN otherwise.
+    """
+    missing = np.isnan(values)
+    if not missing.any():
+        return values.astype(np.int64)
+    if missing.all():
+        return np.full(len(values), None, dtype=object)
+    return values
+
+
 def heatmap_frame(habit: dict, checkins: Sequence[dict], month_start: date, month_end: date) -> pd.DataFrame:
     """
     Build a dataframe for a calendar-like heatmap for one month.
 
     Columns:
       - day (date)
+      - day_num (day of month, None outside the month)
       - done (0/1/None)
       - due (0/1)
       - dow (0..6)
       - week (int, week index within the month)
     """
-    lookup = checkin_lookup(checkins)
-    rows = []
     # Align weeks to Monday for a stable calendar layout
     first_monday = month_start - timedelta(days=month_start.weekday())
-    for d in daterange(first_monday, month_end):
-        due = 1 if is_due_on(habit, d) and (month_start <= d <= month_end) else 0
-        done = lookup.get(d.isoformat(), None) if due else None
-        week = (d - first_monday).days // 7
-        rows.append(
-            {
-                "day": d,
-                "day_num": d.day if (month_start <= d <= month_end) else None,
-                "done": done,
-                "due": due,
-                "dow": d.weekday(),
-                "week": week,
-            }
-        )
-    return pd.DataFrame(rows)
+    days = day_array(first_monday, month_end)
+    dow = weekday_array(days)
+    in_month = days >= np.datetime64(month_start, "D")
+    due = in_month & due_mask(habit, dow)
+
+    # Scatter recorded check-ins onto their calendar slot; NaN = no entry
+    done = np.full(len(days), np.nan)
+    if checkins:
+        pos = (np.array([c["day"] for c in checkins], dtype="datetime64[D]") - days[0]).astype(np.int64)
+        vals = np.array([int(c.get("done", 0)) for c in checkins], dtype=float)
+        ok = (pos >= 0) & (pos < len(days))
+        done[pos[ok]] = vals[ok]
+    done[~due] = np.nan
+
+    day_num = (days - days.astype("datetime64[M]")).astype(np.int64) + 1
+    return pd.DataFrame(
+        {
+            "day": days.astype(object),
+            "day_num": _like_row_inference(np.where(in_month, day_num, np.nan)),
+            "done": _like_row_inference(done),
+            "due": due.astype(np.int64),
+            "dow": dow,
+            "week": np.arange(len(days)) // 7,
+        },
+        copy=False,
+    )
@@ -39,13 +39,16 @@ def main() -> None:
     st.write(f"### Due on {chosen.isoformat()}")
 
     # Preload checkins
-    existing = {h["id"]: db.get_checkin(h["id"], chosen.isoformat()) for h in due}
+    existing = db.get_checkins_for_day(chosen.isoformat())
 
     if st.button("Mark all done"):
+        ts = now_iso()
+        rows = []
         for h in due:
             c = existing.get(h["id"])
             note = c.get("note", "") if c else ""
-            db.upsert_checkin(h["id"], chosen.isoformat(), True, note, now_iso())
+            rows.append((h["id"], chosen.isoformat(), True, note, ts))
+        db.upsert_checkins_bulk(rows)
         toast_success("Saved")
         st.rerun()
 